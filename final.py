@@ -2,185 +2,376 @@ import re
 import fitz  # PyMuPDF
 import numpy as np
 import pytesseract
-from PIL import Image
+import atexit
 import io
 import json
+import math
+import multiprocessing
 import os
+import queue
 import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from dataclasses import dataclass
+from itertools import groupby
+
+try:
+    import tesserocr
+except ImportError:
+    # Optional: keeps Tesseract loaded in-process; otherwise OCR goes
+    # through pytesseract list-file batches.
+    tesserocr = None
+
+PAGES_PER_WORKER = 4
+OCR_ZOOM = 2
+# Rendered font size (px) Tesseract reads reliably; larger text is
+# rasterized at a lower zoom instead of always using OCR_ZOOM.
+OCR_TARGET_PX = 24
+# Font-size bins beyond this share the deepest heading level
+MAX_HEADING_LEVELS = 6
+# Title candidates containing any of these words are skipped
+BANNED_TITLE_RE = re.compile(r"(?i)page|draft|confidential")
+_ZOOM_MAT = fitz.Matrix(OCR_ZOOM, OCR_ZOOM)
+
+@dataclass
+class BlockTable:
+    texts: list
+    fonts: list
+    font_ids: np.ndarray
+    sizes: np.ndarray
+    flags: np.ndarray
+    pages: np.ndarray
+    bboxes: np.ndarray
+    page_heights: np.ndarray
+    text_lens: np.ndarray = None
+    ends_dot: np.ndarray = None
+    style_keys: np.ndarray = None
+
+    def __post_init__(self):
+        if self.style_keys is None:
+            self.style_keys = style_keys(self.font_ids, self.sizes, self.flags)
+
+    def add_text_columns(self):
+        # Derived text columns are only needed on the final merged blocks,
+        # so they are filled in once there rather than for every table.
+        self.text_lens = np.fromiter((len(t) for t in self.texts), dtype=np.int32, count=len(self.texts))
+        self.ends_dot = np.fromiter((ends_with_single_dot(t) for t in self.texts), dtype=np.bool_, count=len(self.texts))
+        return self
+
+    def __len__(self):
+        return len(self.texts)
+
+    def take(self, indices):
+        indices = np.asarray(indices, dtype=np.intp)
+        return BlockTable(
+            texts=[self.texts[i] for i in indices],
+            fonts=[self.fonts[i] for i in indices],
+            font_ids=self.font_ids[indices],
+            sizes=self.sizes[indices],
+            flags=self.flags[indices],
+            pages=self.pages[indices],
+            bboxes=self.bboxes[indices],
+            page_heights=self.page_heights[indices],
+            text_lens=None if self.text_lens is None else self.text_lens[indices],
+            ends_dot=None if self.ends_dot is None else self.ends_dot[indices],
+            style_keys=self.style_keys[indices],
+        )
+
+def style_keys(font_ids, sizes, flags):
+    # Pack (font id, size in 1/100 pt, flags) into one int64 so "same style"
+    # is a single integer comparison.
+    size_q = np.rint(np.asarray(sizes, dtype=np.float64) * 100).astype(np.int64)
+    return ((np.asarray(font_ids, dtype=np.int64) << 40) | (size_q << 20)
+            | (np.asarray(flags, dtype=np.int64) & 0xFFFFF))
+
+def bboxes_intersect_any(bboxes, other_bboxes):
+    # (N, 4) x (K, 4) -> (N,) mask of boxes touching at least one other box
+    B = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+    T = np.asarray(other_bboxes, dtype=np.float64).reshape(-1, 4)
+    no_overlap = ((B[:, None, 2] < T[None, :, 0]) | (T[None, :, 2] < B[:, None, 0])
+                  | (B[:, None, 3] < T[None, :, 1]) | (T[None, :, 3] < B[:, None, 1]))
+    return ~no_overlap.all(axis=1)
+
+def get_tables_bboxes(page):
+    try:
+        return [tuple(t.bbox) for t in page.find_tables().tables]
+    except Exception:
+        # find_tables needs PyMuPDF >= 1.23
+        return []
 
-def merge_bboxes(bboxes):
-    x0 = min(b[0] for b in bboxes)
-    y0 = min(b[1] for b in bboxes)
-    x1 = max(b[2] for b in bboxes)
-    y1 = max(b[3] for b in bboxes)
-    return (x0, y0, x1, y1)
-
-def bbox_intersect(b1, b2):
-    x0_1, y0_1, x1_1, y1_1 = b1
-    x0_2, y0_2, x1_2, y1_2 = b2
-    return not (x1_1 < x0_2 or x1_2 < x0_1 or y1_1 < y0_2 or y1_2 < y0_1)
-
-def get_tables_bboxes(doc):
-    tables_per_page = {}
-    for page_num in range(len(doc)):
-        page = doc.load_page(page_num)
-        try:
-            tables = page.get_text("dict")
-            # Using existing API to find rectangles that might correspond to tables
-            # Alternatively, try page.find_tables() if supported in your pymupdf version
-            # For no API, we'll fallback to empty for now
-            bbox_list = []
-            # Either implement a detection or assume empty
-        except Exception:
-            bbox_list = []
-        tables_per_page[page_num] = bbox_list
-    return tables_per_page
-
-def bbox_in_any(bbox, bbox_list):
-    for b in bbox_list:
-        if bbox_intersect(bbox, b):
-            return True
-    return False
+def run_starts(*columns):
+    # Indices where any of the columns differs from the previous row
+    n = len(columns[0])
+    change = np.ones(n, dtype=bool)
+    if n > 1:
+        change[1:] = False
+        for col in columns:
+            change[1:] |= col[1:] != col[:-1]
+    return np.flatnonzero(change)
+
+def merge_bboxes(bboxes, starts):
+    return np.column_stack([
+        np.minimum.reduceat(bboxes[:, 0], starts),
+        np.minimum.reduceat(bboxes[:, 1], starts),
+        np.maximum.reduceat(bboxes[:, 2], starts),
+        np.maximum.reduceat(bboxes[:, 3], starts),
+    ])
+
+def merge_runs(blocks, starts):
+    if not len(starts):
+        return blocks
+    ends = np.append(starts[1:], len(blocks))
+    return BlockTable(
+        texts=[" ".join(blocks.texts[a:b]) for a, b in zip(starts, ends)],
+        fonts=[blocks.fonts[a] for a in starts],
+        font_ids=blocks.font_ids[starts],
+        sizes=blocks.sizes[starts],
+        flags=blocks.flags[starts],
+        pages=blocks.pages[starts],
+        bboxes=merge_bboxes(blocks.bboxes, starts),
+        page_heights=blocks.page_heights[starts],
+        style_keys=blocks.style_keys[starts],
+    )
 
 def merge_consecutive_blocks(blocks):
-    if not blocks:
-        return []
-    merged = []
-    current = blocks[0].copy()
-    for block in blocks[1:]:
-        if (block["page"] == current["page"]
-            and block["font"] == current["font"]
-            and block["size"] == current["size"]
-            and block["flags"] == current["flags"]):
-            current["text"] += " " + block["text"]
-            current["bbox"] = merge_bboxes([current["bbox"], block["bbox"]])
-        else:
-            merged.append(current)
-            current = block.copy()
-    merged.append(current)
-    return merged
+    starts = run_starts(blocks.pages, blocks.style_keys)
+    return merge_runs(blocks, starts)
 
 def remove_headers_footers(blocks, margin=0.1):
-    headers = set()
-    footers = set()
-    for b in blocks:
-        y0 = b["bbox"][1]
-        y1 = b["bbox"][3]
-        height = b["page_height"]
-        top_margin = height * margin
-        bottom_margin = height * (1 - margin)
-        if y1 <= top_margin:
-            headers.add(id(b))
-        elif y0 >= bottom_margin:
-            footers.add(id(b))
-    return headers, footers
-
-def block_in_tables(page_num, bbox, tables_bbox):
-    if page_num in tables_bbox:
-        return bbox_in_any(bbox, tables_bbox[page_num])
-    return False
-
-def crop_and_ocr(page, bbox, zoom=2):
-    rect = fitz.Rect(bbox)
-    mat = fitz.Matrix(zoom, zoom)
-    pix = page.get_pixmap(matrix=mat, clip=rect, alpha=False)
-    img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-    text = pytesseract.image_to_string(img).strip()
-    return text
+    top_margin = blocks.page_heights * margin
+    bottom_margin = blocks.page_heights * (1 - margin)
+    header_mask = blocks.bboxes[:, 3] <= top_margin
+    footer_mask = ~header_mask & (blocks.bboxes[:, 1] >= bottom_margin)
+    return header_mask, footer_mask
+
+def blocks_in_tables(blocks, tables_bbox):
+    mask = np.zeros(len(blocks), dtype=bool)
+    for page_num, bbox_list in tables_bbox.items():
+        if not bbox_list:
+            continue
+        on_page = np.flatnonzero(blocks.pages == page_num)
+        mask[on_page] = bboxes_intersect_any(blocks.bboxes[on_page], bbox_list)
+    return mask
 
-def parse_pdf(filename):
-    doc = fitz.open(filename)
-    tables_bbox = get_tables_bboxes(doc)
-    all_blocks = []
-    for page_num in range(len(doc)):
+def needs_ocr(text, min_len=3):
+    # Only fall back to Tesseract when the text layer looks unusable:
+    # too short, replacement glyphs, control characters, or no letters/digits.
+    t = text.strip()
+    if len(t) < min_len:
+        return True
+    if "\ufffd" in t or not t.isprintable():
+        return True
+    return not any(ch.isalnum() for ch in t)
+
+def render_page_array(page, zoom=OCR_ZOOM, clip=None):
+    mat = _ZOOM_MAT if zoom == OCR_ZOOM else fitz.Matrix(zoom, zoom)
+    pix = page.get_pixmap(matrix=mat, clip=fitz.Rect(clip) if clip is not None else None, alpha=False)
+    return np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+
+def crop_page_array(arr, bbox, zoom=OCR_ZOOM, origin=(0, 0)):
+    height, width = arr.shape[:2]
+    x0 = min(max(int(math.floor((bbox[0] - origin[0]) * zoom)), 0), width - 1)
+    y0 = min(max(int(math.floor((bbox[1] - origin[1]) * zoom)), 0), height - 1)
+    x1 = min(max(int(math.ceil((bbox[2] - origin[0]) * zoom)), x0 + 1), width)
+    y1 = min(max(int(math.ceil((bbox[3] - origin[1]) * zoom)), y0 + 1), height)
+    return arr[y0:y1, x0:x1]
+
+def write_ppm(path, arr):
+    # Binary PPM is just a header plus the raw RGB rows, which Tesseract
+    # reads directly; no PIL image or PNG encoding needed.
+    height, width = arr.shape[:2]
+    with open(path, "wb") as f:
+        f.write(b"P6\n%d %d\n255\n" % (width, height))
+        f.write(np.ascontiguousarray(arr).tobytes())
+
+def ocr_zoom(size, max_zoom=OCR_ZOOM):
+    return min(max_zoom, max(1.0, OCR_TARGET_PX / size)) if size > 0 else max_zoom
+
+def _ocr_image_list(image_paths, list_path):
+    with open(list_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(image_paths) + "\n")
+    raw = pytesseract.image_to_string(list_path)
+    texts = [t.strip() for t in raw.split("\f")]
+    texts += [""] * (len(image_paths) - len(texts))
+    return texts[:len(image_paths)]
+
+# Idle tesserocr handles, reused across batches so each one loads the
+# language model only once per run.
+_TESS_APIS = queue.SimpleQueue()
+
+def _ocr_arrays(crops):
+    try:
+        api = _TESS_APIS.get_nowait()
+    except queue.Empty:
+        api = tesserocr.PyTessBaseAPI(lang="eng")
+    try:
+        texts = []
+        for crop in crops:
+            height, width = crop.shape[:2]
+            api.SetImageBytes(np.ascontiguousarray(crop).tobytes(), width, height, 3, width * 3)
+            texts.append(api.GetUTF8Text().strip())
+        return texts
+    finally:
+        _TESS_APIS.put(api)
+
+@atexit.register
+def _close_tess_apis():
+    while True:
+        try:
+            _TESS_APIS.get_nowait().End()
+        except queue.Empty:
+            return
+
+def batch_ocr(doc, page_bbox_pairs, zoom=OCR_ZOOM, max_workers=None, font_sizes=None):
+    # OCR every crop in a few Tesseract runs instead of one process per crop:
+    # persistent tesserocr handles when available, else one pytesseract run
+    # per worker over a list file (Tesseract separates the text of each
+    # listed image with a form feed). Rendering stays on this thread since
+    # PyMuPDF pages are not thread-safe, only the OCR runs concurrently.
+    if not page_bbox_pairs:
+        return []
+    crops = [None] * len(page_bbox_pairs)
+    # Rasterize each page with several crops once and slice them out of
+    # the pixel array; a lone crop is cheaper as a clipped render.
+    by_page = sorted(range(len(page_bbox_pairs)), key=lambda i: page_bbox_pairs[i][0])
+    for page_num, indices in groupby(by_page, key=lambda i: page_bbox_pairs[i][0]):
+        page = doc.load_page(page_num)
+        origin = (page.rect.x0, page.rect.y0)
+        indices = list(indices)
+        # The smallest text on the page decides how much zoom it needs
+        page_zoom = zoom
+        if font_sizes is not None:
+            page_zoom = max(ocr_zoom(font_sizes[i], zoom) for i in indices)
+        if len(indices) == 1:
+            i = indices[0]
+            crops[i] = render_page_array(page, page_zoom, clip=page_bbox_pairs[i][1])
+        else:
+            arr = render_page_array(page, page_zoom)
+            for i in indices:
+                crops[i] = np.ascontiguousarray(crop_page_array(arr, page_bbox_pairs[i][1], page_zoom, origin))
+            arr = None
+        page = None
+        fitz.TOOLS.store_shrink(100)
+
+    workers = min(len(crops), max_workers or os.cpu_count() or 1)
+    chunk_size = -(-len(crops) // workers)
+    bounds = [(i, i + chunk_size) for i in range(0, len(crops), chunk_size)]
+    if tesserocr is not None:
+        with ThreadPoolExecutor(max_workers=len(bounds)) as executor:
+            results = executor.map(_ocr_arrays, [crops[a:b] for a, b in bounds])
+            return [t for chunk_texts in results for t in chunk_texts]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        image_paths = [os.path.join(tmp_dir, f"crop_{i}.ppm") for i in range(len(crops))]
+        for path, crop in zip(image_paths, crops):
+            write_ppm(path, crop)
+        chunks = [image_paths[a:b] for a, b in bounds]
+        list_paths = [os.path.join(tmp_dir, f"list_of_images_{i}.txt") for i in range(len(chunks))]
+        with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+            results = executor.map(_ocr_image_list, chunks, list_paths)
+            texts = [t for chunk_texts in results for t in chunk_texts]
+    return texts
+
+def crop_and_ocr(page, bbox, zoom=OCR_ZOOM):
+    return batch_ocr(page.parent, [(page.number, bbox)], zoom=zoom)[0]
+
+SPAN_COLUMNS = ("texts", "fonts", "sizes", "flags", "bboxes", "pages", "page_heights", "line_ids")
+
+def _parse_pages(doc, page_nums):
+    spans = {name: [] for name in SPAN_COLUMNS}
+    tables_bbox = {}
+    line_id = 0
+    for page_num in page_nums:
         page = doc.load_page(page_num)
         raw_blocks = page.get_text("dict")["blocks"]
         height = page.rect.height
-        width = page.rect.width
-        page_blocks = []
         for block in raw_blocks:
             if block["type"] != 0:
                 continue
             for line in block["lines"]:
-                merged_spans = []
-                current = None
+                line_id += 1
                 for span in line["spans"]:
                     text = span["text"].strip()
                     if not text:
                         continue
-                    font = span["font"]
-                    size = span["size"]
-                    flags = span["flags"]
-                    bbox = span["bbox"]
-                    if current is None:
-                        current = {
-                            "text": text,
-                            "font": font,
-                            "size": size,
-                            "flags": flags,
-                            "bboxes": [bbox]
-                        }
-                    else:
-                        if (font == current["font"] and size == current["size"] and flags == current["flags"]):
-                            current["text"] += " " + text
-                            current["bboxes"].append(bbox)
-                        else:
-                            merged_bbox = merge_bboxes(current["bboxes"])
-                            page_blocks.append({
-                                "text": current["text"],
-                                "font": current["font"],
-                                "size": current["size"],
-                                "flags": current["flags"],
-                                "bbox": merged_bbox,
-                                "page": page_num,
-                                "page_height": height,
-                                "page_width": width
-                            })
-                            current = {
-                                "text": text,
-                                "font": font,
-                                "size": size,
-                                "flags": flags,
-                                "bboxes": [bbox]
-                            }
-                if current is not None:
-                    merged_bbox = merge_bboxes(current["bboxes"])
-                    page_blocks.append({
-                        "text": current["text"],
-                        "font": current["font"],
-                        "size": current["size"],
-                        "flags": current["flags"],
-                        "bbox": merged_bbox,
-                        "page": page_num,
-                        "page_height": height,
-                        "page_width": width
-                    })
-        page_blocks = merge_consecutive_blocks(sorted(page_blocks, key=lambda b: b['bbox'][1]))
-        all_blocks.extend(page_blocks)
-    return all_blocks, tables_bbox, doc
+                    spans["texts"].append(text)
+                    spans["fonts"].append(span["font"])
+                    spans["sizes"].append(span["size"])
+                    spans["flags"].append(span["flags"])
+                    spans["bboxes"].append(span["bbox"])
+                    spans["pages"].append(page_num)
+                    spans["page_heights"].append(height)
+                    spans["line_ids"].append(line_id)
+        tables_bbox[page_num] = get_tables_bboxes(page)
+        page = None
+        fitz.TOOLS.store_shrink(100)
+    return spans, tables_bbox
+
+def _parse_pages_worker(filename, page_nums):
+    # Page objects can't be shared across processes, so each worker opens
+    # its own handle on the file.
+    with closing(fitz.open(filename)) as doc:
+        return _parse_pages(doc, page_nums)
+
+def parse_pdf(filename):
+    doc = fitz.open(filename)
+    page_count = len(doc)
+    chunks = [list(range(i, min(i + PAGES_PER_WORKER, page_count)))
+              for i in range(0, page_count, PAGES_PER_WORKER)]
+    workers = min(len(chunks), os.cpu_count() or 1)
+    if workers > 1:
+        with multiprocessing.Pool(workers) as pool:
+            results = pool.starmap(_parse_pages_worker, [(filename, chunk) for chunk in chunks])
+    else:
+        results = [_parse_pages(doc, range(page_count))]
+
+    columns = {name: [] for name in SPAN_COLUMNS}
+    tables_bbox = {}
+    for chunk_spans, chunk_tables in results:
+        for name in SPAN_COLUMNS:
+            columns[name].extend(chunk_spans[name])
+        tables_bbox.update(chunk_tables)
+    texts, fonts, sizes, flags, bboxes, pages, page_heights, line_ids = (columns[name] for name in SPAN_COLUMNS)
+    font_table = {}
+    font_ids = [font_table.setdefault(font, len(font_table)) for font in fonts]
+
+    spans = BlockTable(
+        texts=texts,
+        fonts=fonts,
+        font_ids=np.asarray(font_ids, dtype=np.int32),
+        sizes=np.asarray(sizes, dtype=np.float64),
+        flags=np.asarray(flags, dtype=np.int32),
+        pages=np.asarray(pages, dtype=np.int32),
+        bboxes=np.asarray(bboxes, dtype=np.float64).reshape(-1, 4),
+        page_heights=np.asarray(page_heights, dtype=np.float64),
+    )
+    # Merge same-style spans within a line, order each page top to bottom,
+    # then merge consecutive same-style lines. Line ids are only unique
+    # within a worker's chunk, so page changes also break runs.
+    line_ids = np.asarray(line_ids, dtype=np.int64)
+    lines = merge_runs(spans, run_starts(spans.pages, line_ids, spans.style_keys))
+    lines = lines.take(np.lexsort((lines.bboxes[:, 1], lines.pages)))
+    return merge_consecutive_blocks(lines).add_text_columns(), tables_bbox, doc
 
 def extract_title(blocks, doc):
     candidates = [
-        b for b in blocks if b["page"] in [0, 1]
-        and len(b["text"]) > 5
-        and not any(word in b["text"].lower() for word in ["page", "draft", "confidential"])
+        i for i in np.flatnonzero(blocks.pages <= 1)
+        if len(blocks.texts[i]) > 5
+        and not BANNED_TITLE_RE.search(blocks.texts[i])
     ]
     if not candidates:
         return "", ""
-    candidates.sort(key=lambda b: (-b["size"], b["page"], b["bbox"][1]))
-    title_block = candidates[0]
-    page = doc.load_page(title_block["page"])
-    ocr_text = crop_and_ocr(page, title_block["bbox"])
-    return title_block["text"], ocr_text
+    title_idx = min(candidates, key=lambda i: (-blocks.sizes[i], blocks.pages[i], blocks.bboxes[i, 1]))
+    title_text = blocks.texts[title_idx]
+    if not needs_ocr(title_text):
+        return title_text, ""
+    pairs = [(int(blocks.pages[title_idx]), tuple(blocks.bboxes[title_idx]))]
+    ocr_text = batch_ocr(doc, pairs, font_sizes=[blocks.sizes[title_idx]])[0]
+    return title_text, ocr_text
 
 def ends_with_single_dot(text):
     t = text.strip()
-    if t.endswith(".") and not t.endswith("..."):
-        if len(t) >= 2:
-            return t[-2] != "."
-        else:
-            return True
-    return False
+    return t.endswith(".") and not t.endswith("..")
 
 def heading_level_number(level_str):
     if level_str.upper().startswith("H"):
@@ -190,55 +381,53 @@ def heading_level_number(level_str):
             return None
     return None
 
-def cluster_font_sizes(candidates):
-    sizes = sorted(set(b["size"] for b in candidates), reverse=True)
-    return {size: f"H{i+1}" for i, size in enumerate(sizes)}
+def quantize_sizes(sizes):
+    # Bin font sizes to 0.1 pt so float drift doesn't create extra levels
+    return np.rint(np.asarray(sizes, dtype=np.float64) * 10).astype(np.int64)
 
-def extract_headings(blocks, doc, title_text):
-    if not blocks:
+def cluster_font_sizes(sizes):
+    unique_sizes = np.unique(quantize_sizes(sizes))[::-1]
+    return {int(size): f"H{min(i + 1, MAX_HEADING_LEVELS)}" for i, size in enumerate(unique_sizes)}
+
+def extract_headings(blocks, doc, title_text, indices=None):
+    if indices is None:
+        indices = np.arange(len(blocks))
+    if not len(indices):
         return []
 
-    font_sizes = [b["size"] for b in blocks]
-    threshold = np.mean(font_sizes) + 1.5 if font_sizes else 0
+    sizes = blocks.sizes[indices]
+    text_lens = blocks.text_lens[indices]
+    threshold = sizes.mean() + 1.5
+    mask = (sizes >= threshold) & (text_lens >= 3) & (text_lens <= 150) & ~blocks.ends_dot[indices]
+    mask[-1] = False  # skip last block
 
-    candidates = []
-    for idx, b in enumerate(blocks):
-        txt = b["text"].strip()
-        if idx == len(blocks) - 1:
-            continue  # skip last block
-        if not txt or txt == title_text:
-            continue
-        if len(txt) < 3 or len(txt) > 150:
-            continue
-        if ends_with_single_dot(txt):
-            continue
-        if b["size"] < threshold:
-            continue
-        candidates.append(b)
+    candidates = [idx for idx in indices[mask] if blocks.texts[idx] != title_text]
 
     if not candidates:
         return []
 
-    size_to_level = cluster_font_sizes(candidates)
+    size_to_level = cluster_font_sizes(blocks.sizes[candidates])
+    size_bins = quantize_sizes(blocks.sizes[candidates])
+
+    ocr_texts = [""] * len(candidates)
+    ocr_positions = [pos for pos, i in enumerate(candidates) if needs_ocr(blocks.texts[i])]
+    pairs = [(int(blocks.pages[candidates[pos]]), tuple(blocks.bboxes[candidates[pos]])) for pos in ocr_positions]
+    ocr_sizes = [blocks.sizes[candidates[pos]] for pos in ocr_positions]
+    for pos, ocr_txt in zip(ocr_positions, batch_ocr(doc, pairs, font_sizes=ocr_sizes)):
+        ocr_texts[pos] = ocr_txt
 
     headings = []
-    for c in candidates:
-        level = size_to_level.get(c["size"], "H3")
-        page = doc.load_page(c["page"])
-        ocr_txt = crop_and_ocr(page, c["bbox"])
+    for i, size_bin, ocr_txt in zip(candidates, size_bins, ocr_texts):
+        level = size_to_level[int(size_bin)]
         headings.append({
             "level": level,
-            "text": c["text"],
-            "page": c["page"],
-            "ocr_text": ocr_txt
+            "text": blocks.texts[i],
+            "page": int(blocks.pages[i]),
+            "ocr_text": ocr_txt,
+            "_y": float(blocks.bboxes[i, 1])
         })
 
-    def get_block_y_pos(blk):
-        # Find y position for sorting
-        return blk["bbox"][1]
-
-    headings.sort(key=lambda h: (h["page"], 
-                                 get_block_y_pos(next(c for c in candidates if c["text"] == h["text"] and c["page"] == h["page"]))))
+    headings.sort(key=lambda h: (h["page"], h["_y"]))
     filtered = []
     last_level = None
     for h in headings:
@@ -262,34 +451,37 @@ def main():
 
     print(f"Extracted {len(blocks)} blocks from PDF")
 
-    title_text, title_ocr = extract_title(blocks, doc)
-    print(f"Title Extracted (text): {title_text}")
-    print(f"Title Extracted (OCR): {title_ocr}\n")
-
-    header_blocks, footer_blocks = remove_headers_footers(blocks, margin=0.1)
-    combined_blocks = header_blocks.union(footer_blocks)
+    with closing(doc):
+        title_text, title_ocr = extract_title(blocks, doc)
+        print(f"Title Extracted (text): {title_text}")
+        print(f"Title Extracted (OCR): {title_ocr}\n")
 
-    filtered_blocks = [
-        b for b in blocks
-        if id(b) not in combined_blocks and not block_in_tables(b["page"], b["bbox"], tables)
-    ]
+        header_mask, footer_mask = remove_headers_footers(blocks, margin=0.1)
+        in_table_mask = blocks_in_tables(blocks, tables)
+        keep_idx = np.flatnonzero(~(header_mask | footer_mask | in_table_mask))
 
-    print(f"Blocks after removing headers, footers and tables: {len(filtered_blocks)}")
+        print(f"Blocks after removing headers, footers and tables: {len(keep_idx)}")
 
-    headings = extract_headings(filtered_blocks, doc, title_text)
+        headings = extract_headings(blocks, doc, title_text, keep_idx)
+    fitz.TOOLS.store_shrink(100)
 
     print(f"Extracted {len(headings)} headings:")
     for h in headings:
         print(f"{h['level']} | Page {h['page'] +1} | Text: {h['text']}")
         print(f"OCR Text:\n{h['ocr_text']}\n")
 
-    with open("output.txt", "w", encoding='utf-8') as f:
-        for b in filtered_blocks:
-            f.write(f"Text: {b['text']}\n")
-            f.write(f"Font: {b['font']} | Size: {b['size']} | Bold: {bool(b['flags'] & 2)} | Italic: {bool(b['flags'] & 4)}\n")
-            f.write(f"Page: {b['page'] + 1}\n")
-            f.write(f"BBox: {b['bbox']}\n")
-            f.write("---------\n")
+    chunks = []
+    for i in keep_idx:
+        flags = int(blocks.flags[i])
+        chunks.append(
+            f"Text: {blocks.texts[i]}\n"
+            f"Font: {blocks.fonts[i]} | Size: {float(blocks.sizes[i])} | Bold: {bool(flags & 2)} | Italic: {bool(flags & 4)}\n"
+            f"Page: {blocks.pages[i] + 1}\n"
+            f"BBox: {tuple(blocks.bboxes[i].tolist())}\n"
+            "---------\n"
+        )
+    with open("output.txt", "w", encoding='utf-8', buffering=64 * 1024) as f:
+        f.writelines(chunks)
 
     output_json = {
         "title": title_ocr if title_ocr else title_text,